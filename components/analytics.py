@@ -1,7 +1,7 @@
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
-from components.utils import load_invoices_data
+from components.utils import init_database, load_invoices_data
 
 
 def show_analytics_tab():
@@ -46,11 +46,11 @@ def show_analytics_tab():
         st.markdown('<div class="custom-card">', unsafe_allow_html=True)
         st.subheader("🏢 Spend by Vendor")
         
-        vendor_spend = df.groupby('vendor_name')['total_amount'].sum().sort_values(ascending=False)
+        vendor_spend = init_database().get_vendor_totals()
         
         fig = px.bar(
-            x=vendor_spend.index,
-            y=vendor_spend.values,
+            x=[row['vendor_name'] for row in vendor_spend],
+            y=[row['total_amount'] or 0 for row in vendor_spend],
             labels={'x': 'Vendor', 'y': 'Total Amount ($)'},
             color_discrete_sequence=['#667eea']
         )
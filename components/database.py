@@ -15,6 +15,7 @@ def show_database_tab():
             if db:
                 try:
                     cursor = db.conn.cursor()
+                    cursor.execute("BEGIN")
                     cursor.execute("DELETE FROM line_items")
                     cursor.execute("DELETE FROM invoices")
                     db.conn.commit()
@@ -22,6 +23,7 @@ def show_database_tab():
                     st.session_state.invoices_df = load_invoices_data()
                     st.rerun()
                 except Exception as e:
+                    db.conn.rollback()
                     st.error(f"Error emptying database: {e}")
     
     df = load_invoices_data()
@@ -1,14 +1,62 @@
 import sqlite3
 import json
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Optional, Any, Tuple
 from pathlib import Path
+from itertools import groupby
+from operator import itemgetter
 import os
 
+# Stays below SQLite's default limit of 999 bound parameters on older builds.
+LINE_ITEM_FETCH_CHUNK = 900
+
+# Checked in this order; the first suffix that matches is stripped.
+VENDOR_SUFFIXES = (' inc', ' inc.', ' incorporated', ' corp', ' corp.',
+                   ' corporation', ' ltd', ' ltd.', ' limited', ' llc',
+                   ' llc.', ' pty', ' pty.', ' pty ltd', ' pty ltd.')
+
+AMOUNT_DROP_TABLE = str.maketrans('', '', '$€£,')
+
+# Deletes every ASCII character except letters, digits, '-' and '_'.
+INVOICE_NUMBER_DROP_TABLE = str.maketrans('', '', ''.join(
+    chr(c) for c in range(128) if not (chr(c).isalnum() or chr(c) in '-_')))
+
+DATE_FORMATS = (
+    '%Y-%m-%d',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%Y/%m/%d',
+    '%m-%d-%Y',
+    '%d-%m-%Y',
+    '%Y.%m.%d',
+    '%B %d, %Y',
+    '%b %d, %Y',
+    '%d %B %Y',
+    '%d %b %Y'
+)
+
+
+# The same date strings repeat across the pages of a vendor's invoices, so
+# the strptime attempts (and their ValueErrors) are paid once per string.
+@lru_cache(maxsize=4096)
+def _parse_date(date_str: str) -> Optional[str]:
+    for fmt in DATE_FORMATS:
+        try:
+            dt = datetime.strptime(date_str, fmt)
+            return dt.strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    
+    return None
+
 
 class InvoiceDatabase:
-    def __init__(self, db_path: str = "invoices.db"):
+    def __init__(self, db_path: str = "invoices.db", durable: bool = False):
         self.db_path = db_path
+        # WAL with synchronous=NORMAL never corrupts the database, but a power
+        # loss can drop the last few commits; durable=True keeps FULL fsyncs.
+        self.durable = durable
         self.conn = None
         self._create_tables()
     
@@ -19,8 +67,18 @@ class InvoiceDatabase:
             except:
                 pass
         
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10.0)
+        # Autocommit mode: sqlite3 no longer injects BEGIN before each DML
+        # statement; multi-statement writes open their transaction explicitly.
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10.0,
+                                    cached_statements=512, isolation_level=None)
         self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(f"""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous={'FULL' if self.durable else 'NORMAL'};
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-20000;
+            PRAGMA mmap_size=268435456;
+        """)
         
         cursor = self.conn.cursor()
         
@@ -72,6 +130,11 @@ class InvoiceDatabase:
             ON invoices(invoice_number)
         """)
         
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_invoices_created_id_desc 
+            ON invoices(created_at DESC, id DESC)
+        """)
+        
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_line_items_invoice 
             ON line_items(invoice_id)
@@ -88,17 +151,14 @@ class InvoiceDatabase:
         if not vendor_name:
             return ""
         
-        suffixes = [' inc', ' inc.', ' incorporated', ' corp', ' corp.', 
-                   ' corporation', ' ltd', ' ltd.', ' limited', ' llc', 
-                   ' llc.', ' pty', ' pty.', ' pty ltd', ' pty ltd.']
-        
         normalized = vendor_name.strip()
         normalized_lower = normalized.lower()
         
-        for suffix in suffixes:
-            if normalized_lower.endswith(suffix):
-                normalized = normalized[:-len(suffix)].strip()
-                break
+        if normalized_lower.endswith(VENDOR_SUFFIXES):
+            for suffix in VENDOR_SUFFIXES:
+                if normalized_lower.endswith(suffix):
+                    normalized = normalized[:-len(suffix)].strip()
+                    break
         
         normalized = normalized.title()
         
@@ -108,7 +168,10 @@ class InvoiceDatabase:
         if not invoice_number:
             return ""
         
-        normalized = ''.join(c for c in invoice_number if c.isalnum() or c in ['-', '_'])
+        if invoice_number.isascii():
+            normalized = invoice_number.translate(INVOICE_NUMBER_DROP_TABLE)
+        else:
+            normalized = ''.join(c for c in invoice_number if c.isalnum() or c in '-_')
         normalized = normalized.upper().strip()
         
         return normalized
@@ -117,30 +180,12 @@ class InvoiceDatabase:
         if not date_str:
             return None
         
-        date_formats = [
-            '%Y-%m-%d',
-            '%m/%d/%Y',
-            '%d/%m/%Y',
-            '%Y/%m/%d',
-            '%m-%d-%Y',
-            '%d-%m-%Y',
-            '%Y.%m.%d',
-            '%B %d, %Y',
-            '%b %d, %Y',
-            '%d %B %Y',
-            '%d %b %Y'
-        ]
-        
-        for fmt in date_formats:
-            try:
-                dt = datetime.strptime(date_str.strip(), fmt)
-                return dt.strftime('%Y-%m-%d')
-            except ValueError:
-                continue
-        
-        return None
+        return _parse_date(date_str.strip())
     
     def normalize_amount(self, amount: Any) -> float:
+        if type(amount) is float:
+            return amount
+        
         if amount is None:
             return 0.0
         
@@ -148,8 +193,7 @@ class InvoiceDatabase:
             return float(amount)
         
         if isinstance(amount, str):
-            cleaned = amount.replace('$', '').replace('€', '').replace('£', '')
-            cleaned = cleaned.replace(',', '').strip()
+            cleaned = amount.translate(AMOUNT_DROP_TABLE).strip()
             
             try:
                 return float(cleaned)
@@ -161,22 +205,23 @@ class InvoiceDatabase:
     def validate_invoice(self, invoice_data: Dict[str, Any]) -> Tuple[bool, List[str]]:
         errors = []
         
-        if 'invoice_number' not in invoice_data or not invoice_data.get('invoice_number'):
+        if not invoice_data.get('invoice_number'):
             errors.append("Missing required field: invoice_number")
         
-        if 'vendor_name' not in invoice_data or not invoice_data.get('vendor_name'):
+        if not invoice_data.get('vendor_name'):
             errors.append("Missing required field: vendor_name")
         
-        if 'date' not in invoice_data or not invoice_data.get('date'):
+        date_str = invoice_data.get('date')
+        if not date_str:
             errors.append("Missing required field: date")
         
-        if 'total_amount' not in invoice_data or invoice_data.get('total_amount') is None:
+        if invoice_data.get('total_amount') is None:
             errors.append("Missing required field: total_amount")
         
-        if 'date' in invoice_data and invoice_data['date']:
-            normalized_date = self.normalize_date(invoice_data['date'])
+        if date_str:
+            normalized_date = self.normalize_date(date_str)
             if not normalized_date:
-                errors.append(f"Invalid date format: {invoice_data['date']}")
+                errors.append(f"Invalid date format: {date_str}")
         
         if 'total_amount' in invoice_data:
             try:
@@ -190,10 +235,10 @@ class InvoiceDatabase:
                     errors.append(f"Line item {i} is not a dictionary")
                     continue
                 
-                if 'description' not in item or not item['description']:
+                if not item.get('description'):
                     errors.append(f"Line item {i} missing description")
                 
-                for field in ['quantity', 'unit_price', 'line_total']:
+                for field in ('quantity', 'unit_price', 'line_total'):
                     if field in item:
                         try:
                             float(item[field])
@@ -202,7 +247,8 @@ class InvoiceDatabase:
         
         return len(errors) == 0, errors
     
-    def save_invoice(self, invoice_data: Dict[str, Any], file_path: str = None) -> Optional[int]:
+    def save_invoice(self, invoice_data: Dict[str, Any], file_path: str = None,
+                     commit: bool = True) -> Optional[int]:
         if not self.conn:
             self._create_tables()
         
@@ -244,7 +290,14 @@ class InvoiceDatabase:
         if file_path:
             source_pdf_name = Path(file_path).name
         
+        # Inside a caller's transaction only a savepoint is ours to undo.
+        began = commit and not self.conn.in_transaction
         try:
+            if began:
+                cursor.execute("BEGIN")
+            else:
+                cursor.execute("SAVEPOINT save_invoice")
+            
             cursor.execute("""
                 INSERT INTO invoices (
                     invoice_number, vendor_name, invoice_date, total_amount,
@@ -264,34 +317,39 @@ class InvoiceDatabase:
             invoice_id = cursor.lastrowid
             
             line_items = invoice_data.get('line_items', [])
-            for order, item in enumerate(line_items, 1):
-                description = item.get('description', '').strip()
-                quantity = self.normalize_amount(item.get('quantity', 0))
-                unit_price = self.normalize_amount(item.get('unit_price', 0.0))
-                line_total = self.normalize_amount(item.get('line_total', 0.0))
-                
-                if not description:
-                    continue
-                
-                cursor.execute("""
-                    INSERT INTO line_items (
-                        invoice_id, description, quantity, unit_price, 
-                        line_total, line_order
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                """, (
+            amount = self.normalize_amount
+            rows = [
+                (
                     invoice_id,
                     description,
-                    quantity,
-                    unit_price,
-                    line_total,
+                    amount(item.get('quantity', 0)),
+                    amount(item.get('unit_price', 0.0)),
+                    amount(item.get('line_total', 0.0)),
                     order
-                ))
+                )
+                for order, item in enumerate(line_items, 1)
+                if (description := item.get('description', '').strip())
+            ]
             
-            self.conn.commit()
+            cursor.executemany("""
+                INSERT INTO line_items (
+                    invoice_id, description, quantity, unit_price, 
+                    line_total, line_order
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            
+            if began:
+                self.conn.commit()
+            else:
+                cursor.execute("RELEASE SAVEPOINT save_invoice")
             return invoice_id
             
         except sqlite3.Error as e:
-            self.conn.rollback()
+            if began:
+                self.conn.rollback()
+            else:
+                cursor.execute("ROLLBACK TO SAVEPOINT save_invoice")
+                cursor.execute("RELEASE SAVEPOINT save_invoice")
             print(f"Database error saving invoice: {e}")
             return None
     
@@ -305,7 +363,35 @@ class InvoiceDatabase:
         saved_invoices = []
         errors = []
         
-        pages = result.get('pages', [])
+        if not self.conn:
+            self._create_tables()
+        
+        # One transaction for the whole PDF; save_invoice uses a savepoint per
+        # page so a failing page does not undo the others. A transaction the
+        # caller already opened is left for the caller to commit.
+        began = not self.conn.in_transaction
+        if began:
+            self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            pages = result.get('pages', [])
+            self._save_pages(pages, file_path, saved_invoices, errors)
+        except Exception:
+            if began:
+                self.conn.rollback()
+            raise
+        if began:
+            self.conn.commit()
+        
+        return {
+            'saved': len(saved_invoices) > 0,
+            'invoice_ids': saved_invoices,
+            'errors': errors,
+            'total_pages': len(pages),
+            'saved_pages': len(saved_invoices)
+        }
+    
+    def _save_pages(self, pages: List[Dict[str, Any]], file_path: str,
+                    saved_invoices: List[Dict[str, Any]], errors: List[str]):
         for page in pages:
             if 'error' in page:
                 continue
@@ -375,7 +461,7 @@ class InvoiceDatabase:
                 errors.append(f"Page {page_num}: Invoice {invoice_number} already exists in database")
                 continue
             
-            invoice_id = self.save_invoice(page, file_path)
+            invoice_id = self.save_invoice(page, file_path, commit=False)
             if invoice_id:
                 saved_invoices.append({
                     'invoice_id': invoice_id,
@@ -384,14 +470,6 @@ class InvoiceDatabase:
                 })
             else:
                 errors.append(f"Page {page_num}: Failed to save invoice {invoice_number} - database error occurred")
-        
-        return {
-            'saved': len(saved_invoices) > 0,
-            'invoice_ids': saved_invoices,
-            'errors': errors,
-            'total_pages': len(pages),
-            'saved_pages': len(saved_invoices)
-        }
     
     def get_invoice(self, invoice_id: int) -> Optional[Dict[str, Any]]:
         if not self.conn:
@@ -425,27 +503,55 @@ class InvoiceDatabase:
         
         cursor = self.conn.cursor()
         
-        query = "SELECT * FROM invoices ORDER BY created_at DESC"
+        query = "SELECT * FROM invoices ORDER BY created_at DESC, id DESC"
+        params = ()
         if limit:
-            query += f" LIMIT {limit} OFFSET {offset}"
+            query += " LIMIT ? OFFSET ?"
+            params = (limit, offset)
         
-        cursor.execute(query)
+        cursor.execute(query, params)
         invoice_rows = cursor.fetchall()
         
-        invoices = []
-        for invoice_row in invoice_rows:
-            invoice = dict(invoice_row)
-            invoice_id = invoice['id']
-            
-            cursor.execute("""
+        return self._with_line_items(cursor, invoice_rows)
+    
+    def get_invoices_after(self, cursor_created_at: str, cursor_id: int,
+                           limit: int = 50) -> List[Dict[str, Any]]:
+        # Keyset pagination: pass the created_at and id of the last invoice of
+        # the previous page; seeks on idx_invoices_created_id_desc instead of
+        # OFFSET. created_at has one-second resolution, so id breaks ties.
+        if not self.conn:
+            self._create_tables()
+        
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT * FROM invoices 
+            WHERE (created_at, id) < (?, ?)
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """, (cursor_created_at, cursor_id, limit))
+        invoice_rows = cursor.fetchall()
+        
+        return self._with_line_items(cursor, invoice_rows)
+    
+    def _with_line_items(self, cursor, invoice_rows) -> List[Dict[str, Any]]:
+        # One IN query per chunk of invoices instead of one query per invoice.
+        invoices = [dict(row) for row in invoice_rows]
+        by_id = {}
+        for invoice in invoices:
+            invoice['line_items'] = []
+            by_id[invoice['id']] = invoice['line_items']
+        
+        ids = list(by_id)
+        for start in range(0, len(ids), LINE_ITEM_FETCH_CHUNK):
+            chunk = ids[start:start + LINE_ITEM_FETCH_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f"""
                 SELECT * FROM line_items 
-                WHERE invoice_id = ? 
-                ORDER BY line_order
-            """, (invoice_id,))
-            line_item_rows = cursor.fetchall()
-            invoice['line_items'] = [dict(item) for item in line_item_rows]
-            
-            invoices.append(invoice)
+                WHERE invoice_id IN ({placeholders}) 
+                ORDER BY invoice_id, line_order
+            """, chunk)
+            for invoice_id, items in groupby(cursor.fetchall(), key=itemgetter('invoice_id')):
+                by_id[invoice_id].extend(dict(item) for item in items)
         
         return invoices
     
@@ -479,22 +585,7 @@ class InvoiceDatabase:
         """, (f"%{vendor_name}%",))
         
         invoice_rows = cursor.fetchall()
-        invoices = []
-        for invoice_row in invoice_rows:
-            invoice = dict(invoice_row)
-            invoice_id = invoice['id']
-            
-            cursor.execute("""
-                SELECT * FROM line_items 
-                WHERE invoice_id = ? 
-                ORDER BY line_order
-            """, (invoice_id,))
-            line_item_rows = cursor.fetchall()
-            invoice['line_items'] = [dict(item) for item in line_item_rows]
-            
-            invoices.append(invoice)
-        
-        return invoices
+        return self._with_line_items(cursor, invoice_rows)
     
     def get_fact_table_data(self, invoice_ids: List[int] = None) -> List[Dict[str, Any]]:
         if not self.conn:
@@ -576,8 +667,30 @@ class InvoiceDatabase:
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
     
+    def get_vendor_totals(self) -> List[Dict[str, Any]]:
+        if not self.conn:
+            self._create_tables()
+        
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT vendor_name, COUNT(*) AS invoice_count, SUM(total_amount) AS total_amount
+            FROM invoices
+            WHERE vendor_name IS NOT NULL
+            GROUP BY vendor_name
+            ORDER BY total_amount DESC
+        """)
+        rows = cursor.fetchall()
+        return [dict(row) for row in rows]
+    
     def close(self):
         if self.conn:
+            # Refresh planner stats and fold the WAL back into the main file
+            # so the next open starts from a compact database.
+            try:
+                self.conn.execute("PRAGMA optimize")
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error:
+                pass
             self.conn.close()
             self.conn = None
     
@@ -588,6 +701,6 @@ class InvoiceDatabase:
         self.close()
 
 
-def init_database(db_path: str = "invoices.db") -> InvoiceDatabase:
-    return InvoiceDatabase(db_path)
+def init_database(db_path: str = "invoices.db", durable: bool = False) -> InvoiceDatabase:
+    return InvoiceDatabase(db_path, durable=durable)
 
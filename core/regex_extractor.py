@@ -1,5 +1,8 @@
 import re
-from typing import Dict, List, Optional, Any
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Any, Tuple
+from dataclasses import dataclass, field, asdict
 from datetime import datetime
 
 try:
@@ -16,6 +19,39 @@ except ImportError:
     VENDOR_REGISTRY_AVAILABLE = False
     print("Warning: vendor_registry not available - using hardcoded patterns")
 
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+
+# Every fallback vendor pattern contains one of these literals, so a plain
+# substring check can reject unrelated text before any regex runs.
+FALLBACK_VENDOR_ANCHORS = ("frank", "3800", "pacific", "customer")
+
+CORRECTION_CACHE_SIZE = 128
+
+# Ordered by priority: the first matching pattern decides the vendor.
+FALLBACK_VENDOR_PATTERNS = [
+    ("franks", r"frank['']?s?\s+quality\s+produce"),
+    ("franks", r"warehouse@franksproduce\.net"),
+    ("franks", r"3800\s+1st\s+ave\s+s"),
+    ("pacific", r"pacific\s+food\s+importers?"),
+    ("pacific", r"customer\s+copy[^\n]{0,200}?kent[^\n]{0,50}?wa"),
+]
+
+
+@dataclass
+class ExtractionResult:
+    vendor_name: str
+    invoice_number: str = ""
+    date: str = ""
+    total_amount: float = 0.0
+    line_items: List[Dict[str, Any]] = field(default_factory=list)
+    _confidence: float = 0.0
+    _method: str = "regex"
+
 
 class RegexInvoiceExtractor:
     def __init__(self, use_vendor_registry: bool = True):
@@ -25,6 +61,12 @@ class RegexInvoiceExtractor:
             self.corrector = None
         
         self.use_vendor_registry = use_vendor_registry and VENDOR_REGISTRY_AVAILABLE
+        self._invoice_number_patterns: Dict[Tuple[str, str], Tuple[re.Pattern, re.Pattern]] = {}
+        self._correction_cache: Dict[str, str] = {}
+        self._correction_cache_lock = threading.Lock()
+        # Set in pool workers: learn events are collected here and applied by
+        # the parent, which owns the registry file.
+        self._learn_events: Optional[List[Tuple[str, Dict[str, Any], bool]]] = None
         
         if self.use_vendor_registry:
             try:
@@ -57,6 +99,23 @@ class RegexInvoiceExtractor:
                 "table_header": r"PRODUCT\s*ID[\s\n]+ORDERED[\s\n]+SHIPPED",
             }
         }
+        self._vendor_multi = self._build_vendor_multi()
+    
+    def _build_vendor_multi(self):
+        if not RE2_AVAILABLE:
+            return None
+        
+        try:
+            options = re2.Options()
+            options.case_sensitive = False
+            vendor_multi = re2.Set.SearchSet(options)
+            for _, pattern in FALLBACK_VENDOR_PATTERNS:
+                vendor_multi.Add(pattern)
+            vendor_multi.Compile()
+            return vendor_multi
+        except Exception as e:
+            print(f"Warning: Could not build re2 vendor set: {e}")
+            return None
     
     def detect_vendor(self, text: str, debug: bool = False) -> Optional[str]:
         if self.use_vendor_registry:
@@ -80,29 +139,30 @@ class RegexInvoiceExtractor:
     
     def _detect_vendor_fallback(self, text: str, debug: bool = False) -> Optional[str]:
         text_lower = text.lower()
+
+        if not any(anchor in text_lower for anchor in FALLBACK_VENDOR_ANCHORS):
+            if debug:
+                print(f"  [DEBUG] Vendor not detected (no vendor anchors in text)")
+            return None
+
+        if self._vendor_multi is not None:
+            matched_ids = self._vendor_multi.Match(text_lower)
+            match = FALLBACK_VENDOR_PATTERNS[min(matched_ids)] if matched_ids else None
+        else:
+            match = next(
+                (
+                    (vendor_id, pattern)
+                    for vendor_id, pattern in FALLBACK_VENDOR_PATTERNS
+                    if re.search(pattern, text_lower, re.IGNORECASE)
+                ),
+                None
+            )
         
-        franks_patterns = [
-            r"frank['']?s?\s+quality\s+produce",
-            r"warehouse@franksproduce\.net",
-            r"3800\s+1st\s+ave\s+s",
-        ]
-        
-        for pattern in franks_patterns:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                if debug:
-                    print(f"  [DEBUG] Vendor: Frank's Quality Produce (pattern: {pattern})")
-                return "franks"
-        
-        pacific_patterns = [
-            r"pacific\s+food\s+importers?",
-            r"customer\s+copy.*kent.*wa",
-        ]
-        
-        for pattern in pacific_patterns:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                if debug:
-                    print(f"  [DEBUG] Vendor: Pacific Food Importers (pattern: {pattern})")
-                return "pacific"
+        if match:
+            vendor_id, pattern = match
+            if debug:
+                print(f"  [DEBUG] Vendor: {self._get_vendor_name(vendor_id, None)} (pattern: {pattern})")
+            return vendor_id
         
         if debug:
             print(f"  [DEBUG] Vendor not detected")
@@ -111,7 +171,7 @@ class RegexInvoiceExtractor:
     
     def extract(self, ocr_text: str, debug: bool = False) -> Optional[Dict[str, Any]]:
         if self.corrector:
-            corrected_text = self.corrector.correct_text(ocr_text, debug=debug)
+            corrected_text = self._correct_text(ocr_text, debug)
             if debug:
                 validation = self.corrector.validate_invoice_text(corrected_text)
                 if not validation.get("all_passed", True):
@@ -153,29 +213,81 @@ class RegexInvoiceExtractor:
                 return None
         
         confidence = self._calculate_confidence(result, debug)
-        result["_confidence"] = confidence
-        result["_method"] = "regex"
+        result._confidence = confidence
         
         if debug:
             print(f"  [DEBUG] Confidence score: {confidence:.2f}")
         if self.use_vendor_registry and vendor_pattern:
-            try:
-                self.vendor_registry.learn_from_invoice(
-                    vendor_id=vendor_pattern.vendor_id,
-                    extracted_data=result,
-                    was_successful=(confidence >= 0.60)
+            if self._learn_events is not None:
+                self._learn_events.append(
+                    (vendor_pattern.vendor_id, asdict(result), confidence >= 0.60)
                 )
-            except Exception as e:
-                if debug:
-                    print(f"  [DEBUG] Could not update registry: {e}")
+            else:
+                try:
+                    self.vendor_registry.learn_from_invoice(
+                        vendor_id=vendor_pattern.vendor_id,
+                        extracted_data=asdict(result),
+                        was_successful=(confidence >= 0.60)
+                    )
+                except Exception as e:
+                    if debug:
+                        print(f"  [DEBUG] Could not update registry: {e}")
         
         if confidence >= 0.60:
-            return result
+            return asdict(result)
         elif debug:
             print(f"  [DEBUG] Confidence too low ({confidence:.2f} < 0.60)")
         
         return None
     
+    def extract_many(
+        self,
+        texts: List[str],
+        debug: bool = False,
+        workers: Optional[int] = None
+    ) -> List[Optional[Dict[str, Any]]]:
+        if workers == 1 or len(texts) < 2:
+            return [self.extract(text, debug=debug) for text in texts]
+        
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.use_vendor_registry,)
+        ) as executor:
+            outcomes = list(executor.map(_extract_in_worker, texts, [debug] * len(texts)))
+        
+        # Workers only report what they learned; applying it here keeps one
+        # writer for the registry file and this process's copy current.
+        results = []
+        for result, learn_events in outcomes:
+            for vendor_id, extracted_data, was_successful in learn_events:
+                try:
+                    self.vendor_registry.learn_from_invoice(
+                        vendor_id=vendor_id,
+                        extracted_data=extracted_data,
+                        was_successful=was_successful
+                    )
+                except Exception as e:
+                    if debug:
+                        print(f"  [DEBUG] Could not update registry: {e}")
+            results.append(result)
+        return results
+    
+    def _correct_text(self, ocr_text: str, debug: bool) -> str:
+        if debug:
+            return self.corrector.correct_text(ocr_text, debug=True)
+        
+        with self._correction_cache_lock:
+            corrected_text = self._correction_cache.get(ocr_text)
+        if corrected_text is None:
+            corrected_text = self.corrector.correct_text(ocr_text)
+            with self._correction_cache_lock:
+                if len(self._correction_cache) >= CORRECTION_CACHE_SIZE:
+                    self._correction_cache.pop(next(iter(self._correction_cache)), None)
+                self._correction_cache[ocr_text] = corrected_text
+        
+        return corrected_text
+    
     def _get_vendor_pattern(self, vendor_id: str) -> Optional[VendorPattern]:
         registry_id = vendor_id
         if vendor_id == "pacific":
@@ -192,32 +304,28 @@ class RegexInvoiceExtractor:
         vendor_id: str,
         vendor_pattern: Optional[VendorPattern],
         debug: bool
-    ) -> Optional[Dict[str, Any]]:
-        result = {
-            "vendor_name": self._get_vendor_name(vendor_id, vendor_pattern),
-            "invoice_number": "",
-            "date": "",
-            "total_amount": 0.0,
-            "line_items": []
-        }
+    ) -> Optional[ExtractionResult]:
+        result = ExtractionResult(
+            vendor_name=self._get_vendor_name(vendor_id, vendor_pattern)
+        )
         invoice_num = self._extract_invoice_number(
             text, vendor_id, vendor_pattern, debug
         )
         if invoice_num:
-            result["invoice_number"] = invoice_num
+            result.invoice_number = invoice_num
         
         date = self._extract_date(text, vendor_id, vendor_pattern, debug)
         if date:
-            result["date"] = date
+            result.date = date
         
         total = self._extract_total(text, vendor_id, vendor_pattern, debug)
         if total:
-            result["total_amount"] = total
+            result.total_amount = total
         
         line_items = self._extract_line_items(
             text, vendor_id, vendor_pattern, debug
         )
-        result["line_items"] = line_items
+        result.line_items = line_items
         
         return result
     
@@ -244,17 +352,12 @@ class RegexInvoiceExtractor:
         debug: bool
     ) -> Optional[str]:
         if vendor_pattern:
-            label = vendor_pattern.invoice_number_label
-            regex = vendor_pattern.invoice_number_regex
-            
-            regex_pattern = regex.lstrip('^').rstrip('$')
-            search_pattern = rf"{re.escape(label)}[\s\n#:]*({regex_pattern})(?:\s|$|[^\d])"
+            labeled_re, bare_re = self._get_invoice_number_patterns(vendor_pattern)
             
-            match = re.search(search_pattern, text, re.IGNORECASE | re.MULTILINE)
+            match = labeled_re.search(text)
             
             if not match:
-                regex_pattern = regex.lstrip('^').rstrip('$')
-                match = re.search(rf"\b({regex_pattern})\b", text, re.IGNORECASE)
+                match = bare_re.search(text)
             
             if match:
                 invoice_num = match.group(1) if len(match.groups()) >= 1 else match.group(0)
@@ -277,6 +380,27 @@ class RegexInvoiceExtractor:
         else:
             return self._extract_invoice_number_fallback(text, vendor_id, debug)
     
+    def _get_invoice_number_patterns(
+        self,
+        vendor_pattern: VendorPattern
+    ) -> Tuple[re.Pattern, re.Pattern]:
+        key = (vendor_pattern.invoice_number_label, vendor_pattern.invoice_number_regex)
+        patterns = self._invoice_number_patterns.get(key)
+        
+        if patterns is None:
+            label, regex = key
+            regex_pattern = regex.lstrip('^').rstrip('$')
+            patterns = (
+                re.compile(
+                    rf"{re.escape(label)}[\s\n#:]*({regex_pattern})(?:\s|$|[^\d])",
+                    re.IGNORECASE | re.MULTILINE
+                ),
+                re.compile(rf"\b({regex_pattern})\b", re.IGNORECASE)
+            )
+            self._invoice_number_patterns[key] = patterns
+        
+        return patterns
+    
     def _extract_invoice_number_fallback(
         self,
         text: str,
@@ -527,13 +651,13 @@ class RegexInvoiceExtractor:
     
     def _validate_with_registry(
         self,
-        result: Dict[str, Any],
+        result: ExtractionResult,
         vendor_pattern: VendorPattern,
         debug: bool
     ) -> bool:
-        if result.get("invoice_number"):
+        if result.invoice_number:
             is_valid, error = self.vendor_registry.validate_invoice_number(
-                result["invoice_number"],
+                result.invoice_number,
                 vendor_pattern,
                 debug=debug
             )
@@ -543,35 +667,35 @@ class RegexInvoiceExtractor:
                     print(f"  [DEBUG] Validation failed: {error}")
                 return False
         
-        if result.get("vendor_name"):
-            if result["vendor_name"] != vendor_pattern.vendor_name:
+        if result.vendor_name:
+            if result.vendor_name != vendor_pattern.vendor_name:
                 if debug:
-                    print(f"  [DEBUG] Vendor name mismatch: '{result['vendor_name']}' != '{vendor_pattern.vendor_name}'")
-                result["vendor_name"] = vendor_pattern.vendor_name
+                    print(f"  [DEBUG] Vendor name mismatch: '{result.vendor_name}' != '{vendor_pattern.vendor_name}'")
+                result.vendor_name = vendor_pattern.vendor_name
         
         return True
     
-    def _calculate_confidence(self, result: Dict, debug: bool = False) -> float:
+    def _calculate_confidence(self, result: ExtractionResult, debug: bool = False) -> float:
         confidence = 0.0
         breakdown = {}
         
-        if result.get("vendor_name"):
+        if result.vendor_name:
             confidence += 0.10
             breakdown["vendor"] = 0.10
         
-        if result.get("invoice_number"):
+        if result.invoice_number:
             confidence += 0.10
             breakdown["invoice_number"] = 0.10
         
-        if result.get("date"):
+        if result.date:
             confidence += 0.10
             breakdown["date"] = 0.10
         
-        if result.get("total_amount") and result["total_amount"] > 0:
+        if result.total_amount and result.total_amount > 0:
             confidence += 0.10
             breakdown["total"] = 0.10
         
-        line_items = result.get("line_items", [])
+        line_items = result.line_items
         if line_items:
             valid_items = sum(
                 1 for item in line_items
@@ -590,9 +714,9 @@ class RegexInvoiceExtractor:
                     confidence += 0.10
                     breakdown["line_items_bonus"] = 0.10
         
-        if line_items and result.get("total_amount"):
+        if line_items and result.total_amount:
             line_sum = sum(item.get("line_total", 0) for item in line_items)
-            total = result["total_amount"]
+            total = result.total_amount
             
             if total > 0:
                 variance = abs(line_sum - total) / total
@@ -618,6 +742,21 @@ class RegexInvoiceExtractor:
         return min(confidence, 1.0)
 
 
+_worker_extractor: Optional[RegexInvoiceExtractor] = None
+
+
+def _init_worker(use_vendor_registry: bool):
+    global _worker_extractor
+    _worker_extractor = RegexInvoiceExtractor(use_vendor_registry=use_vendor_registry)
+    _worker_extractor._learn_events = []
+
+
+def _extract_in_worker(text: str, debug: bool) -> Tuple[Optional[Dict[str, Any]], List[Tuple[str, Dict[str, Any], bool]]]:
+    _worker_extractor._learn_events = []
+    result = _worker_extractor.extract(text, debug=debug)
+    return result, _worker_extractor._learn_events
+
+
 def test_extractor():
     extractor = RegexInvoiceExtractor()
     
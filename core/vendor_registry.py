@@ -1,10 +1,108 @@
+import os
 import re
+import sys
 import json
-from typing import Dict, List, Optional, Any, Tuple
+import mmap
+import time
+import atexit
+import tempfile
+import threading
+from bisect import bisect_right
+from typing import Callable, Dict, List, Optional, Any, Tuple
 from pathlib import Path
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+
+# Backreferences and named groups would be renumbered or clash once a pattern
+# is folded into the combined vendor-name scanner.
+UNSAFE_IN_ALTERNATION = re.compile(r"\\[1-9]|\(\?P[<=]")
+
+# Anchors and lookarounds behave differently once vendor names are joined into
+# one string for a batch scan, so patterns using them are scanned per name.
+UNSAFE_IN_BATCH = re.compile(r"[\^$]|\\[AZ]|\(\?[=!<]")
+
+# Prefix patterns that are just an anchored literal are checked with
+# str.startswith instead of the regex engine.
+LITERAL_PREFIX = re.compile(r"\^?([A-Za-z0-9_\-]+)")
+
+DETECT_CACHE_SIZE = 4096
+
+
+def _match_length_bounds(regex: str) -> Tuple[int, int]:
+    # Any match consumes at least the regex's minimum width; the maximum only
+    # bounds the whole string when the top-level sequence ends in a plain $.
+    try:
+        parsed = sre_parse.parse(regex)
+        min_width, max_width = parsed.getwidth()
+        end_anchored = (
+            len(parsed) > 0
+            and parsed[-1] == (sre_parse.AT, sre_parse.AT_END)
+            and not parsed.state.flags & re.MULTILINE
+        )
+    except Exception:
+        return 0, sys.maxsize
+    return min_width, max_width if end_anchored else sys.maxsize
+
+
+def _anchored_body(regex: str) -> Optional[str]:
+    # For a plain ^body$ regex, return body so it can be run with fullmatch;
+    # top-level alternations and MULTILINE patterns are left as they are.
+    if not (regex.startswith("^") and regex.endswith("$")):
+        return None
+    try:
+        parsed = sre_parse.parse(regex)
+    except Exception:
+        return None
+    if (
+        len(parsed) < 2
+        or parsed[0] != (sre_parse.AT, sre_parse.AT_BEGINNING)
+        or parsed[-1] != (sre_parse.AT, sre_parse.AT_END)
+        or parsed.state.flags & re.MULTILINE
+    ):
+        return None
+    return regex[1:-1]
+
+
+_timestamp_cache: Tuple[int, str] = (-1, "")
+
+
+def _timestamp() -> str:
+    # last_updated is stored to the second (it used to carry microseconds),
+    # so every update within the same second reuses the formatted string.
+    global _timestamp_cache
+    second = int(time.time())
+    if _timestamp_cache[0] != second:
+        _timestamp_cache = (second, datetime.now().isoformat(timespec="seconds"))
+    return _timestamp_cache[1]
+
+
+def _is_lowercase_pattern(pattern: str) -> bool:
+    # Name patterns only ever run against lowercased text, so patterns
+    # without uppercase characters can skip case-insensitive matching.
+    # Uppercase ones (including escapes like \S or \D) keep IGNORECASE.
+    return pattern == pattern.lower()
+
+# learn_from_invoice only rewrites the registry file once this many updates
+# are pending or this many seconds have passed since the last save; pending
+# updates are flushed at interpreter exit.
+LEARN_FLUSH_EVERY = 20
+LEARN_FLUSH_SECONDS = 5.0
+
+# Registries at least this large are parsed straight from a memory map.
+MMAP_MIN_REGISTRY_BYTES = 64 * 1024
+
 
 @dataclass
 class VendorPattern:
@@ -22,23 +120,103 @@ class VendorPattern:
     sample_count: int = 0
     last_updated: str = ""
     notes: str = ""
+    _name_res: List[re.Pattern] = field(init=False, repr=False, compare=False)
+    _prefix_res: List[re.Pattern] = field(init=False, repr=False, compare=False)
+    _literal_prefixes: Tuple[str, ...] = field(init=False, repr=False, compare=False)
+    _regex_prefixes: List[re.Pattern] = field(init=False, repr=False, compare=False)
+    _invnum_re: re.Pattern = field(init=False, repr=False, compare=False)
+    _invnum_match: Callable[[str], Optional[re.Match]] = field(init=False, repr=False, compare=False)
+    _invnum_lengths: Tuple[int, int] = field(init=False, repr=False, compare=False)
+    _serialized: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
+    _instructions: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self._name_res = [
+            re.compile(p) if _is_lowercase_pattern(p) else re.compile(p, re.IGNORECASE)
+            for p in self.name_patterns
+        ]
+        self._prefix_res = [re.compile(p) for p in self.invoice_prefix_patterns]
+        body = _anchored_body(self.invoice_number_regex)
+        if body is None:
+            self._invnum_re = re.compile(self.invoice_number_regex)
+            self._invnum_match = self._invnum_re.match
+        else:
+            self._invnum_re = re.compile(body)
+            self._invnum_match = self._invnum_re.fullmatch
+        self._invnum_lengths = _match_length_bounds(self.invoice_number_regex)
+        
+        literals = []
+        self._regex_prefixes = []
+        for pattern in self._prefix_res:
+            literal = LITERAL_PREFIX.fullmatch(pattern.pattern)
+            if literal:
+                literals.append(literal.group(1))
+            else:
+                self._regex_prefixes.append(pattern)
+        self._literal_prefixes = tuple(literals)
+    
+    def match_invoice_prefix(self, invoice_number: str) -> Optional[str]:
+        if not (
+            invoice_number.startswith(self._literal_prefixes)
+            or any(pattern.match(invoice_number) for pattern in self._regex_prefixes)
+        ):
+            return None
+        
+        for pattern in self._prefix_res:
+            if pattern.match(invoice_number):
+                return pattern.pattern
+        return None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        # Fields hold only strings and numbers, so one level of copying
+        # gives callers the same independence asdict()'s deep copy did.
+        data = dict(self._serialize())
+        data["name_patterns"] = list(self.name_patterns)
+        data["invoice_prefix_patterns"] = list(self.invoice_prefix_patterns)
+        data["column_mappings"] = dict(self.column_mappings)
+        return data
+    
+    def _serialize(self) -> Dict[str, Any]:
+        # Shallow and cached until the vendor is marked changed; only used to
+        # write the registry file, callers get deep copies from to_dict().
+        if self._serialized is None:
+            self._serialized = {name: getattr(self, name) for name in SERIALIZED_FIELDS}
+        return self._serialized
+
+
+SERIALIZED_FIELDS = tuple(f.name for f in fields(VendorPattern) if not f.name.startswith("_"))
 
 
 class VendorRegistry:
     def __init__(self, registry_file: str = "vendor_registry.json"):
         self.registry_file = Path(registry_file)
         self.vendors: Dict[str, VendorPattern] = {}
+        self._detect_cache: Dict[Tuple[str, str], Optional[str]] = {}
+        self._pending_learns = 0
+        self._last_save = time.monotonic()
+        # Page threads learn, detect and save concurrently; serialize the
+        # vendor updates, the detect cache and the file swap.
+        self._save_lock = threading.RLock()
         self.load_registry()
+        atexit.register(self.flush)
     
     def load_registry(self):
         if self.registry_file.exists():
             try:
-                with open(self.registry_file, 'r') as f:
-                    data = json.load(f)
-                    self.vendors = {
-                        v_id: VendorPattern(**v_data)
-                        for v_id, v_data in data.items()
-                    }
+                if ORJSON_AVAILABLE and self.registry_file.stat().st_size >= MMAP_MIN_REGISTRY_BYTES:
+                    with open(self.registry_file, 'rb') as f, \
+                            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                            memoryview(mm) as view:
+                        data = orjson.loads(view)
+                elif ORJSON_AVAILABLE:
+                    data = orjson.loads(self.registry_file.read_bytes())
+                else:
+                    with open(self.registry_file, 'r') as f:
+                        data = json.load(f)
+                self.vendors = {
+                    v_id: VendorPattern(**v_data)
+                    for v_id, v_data in data.items()
+                }
                 print(f"✓ Loaded {len(self.vendors)} vendors from registry")
             except Exception as e:
                 print(f"Warning: Could not load vendor registry: {e}")
@@ -47,6 +225,118 @@ class VendorRegistry:
             print("No vendor registry found, creating with defaults")
             self._initialize_default_vendors()
             self.save_registry()
+        
+        self._compile_combined()
+        self._build_prefix_index()
+        self._detect_cache.clear()
+    
+    def _build_prefix_index(self):
+        self._vendor_order = {v_id: i for i, v_id in enumerate(self.vendors)}
+        self._prefix_index: Dict[str, List[str]] = {}
+        self._regex_prefix_vendors: List[str] = []
+        
+        for v_id, vendor in self.vendors.items():
+            for literal in vendor._literal_prefixes:
+                owners = self._prefix_index.setdefault(literal, [])
+                if v_id not in owners:
+                    owners.append(v_id)
+            if vendor._regex_prefixes:
+                self._regex_prefix_vendors.append(v_id)
+        
+        self._prefix_lengths = sorted({len(literal) for literal in self._prefix_index}, reverse=True)
+    
+    def _match_invoice_prefixes(self, inv_str: str) -> Dict[str, str]:
+        candidates = set(self._regex_prefix_vendors)
+        for length in self._prefix_lengths:
+            if length <= len(inv_str):
+                candidates.update(self._prefix_index.get(inv_str[:length], ()))
+        
+        hits = {}
+        for v_id in candidates:
+            prefix = self.vendors[v_id].match_invoice_prefix(inv_str)
+            if prefix is not None:
+                hits[v_id] = prefix
+        return hits
+    
+    def _in_registry_order(self, vendor_ids) -> List[str]:
+        return sorted(vendor_ids, key=self._vendor_order.__getitem__)
+    
+    def _compile_combined(self):
+        alternatives = []
+        
+        for vendor in self.vendors.values():
+            for pattern in vendor.name_patterns:
+                if UNSAFE_IN_ALTERNATION.search(pattern):
+                    self._vendor_name_scanner = None
+                    return
+                alternatives.append(pattern if _is_lowercase_pattern(pattern) else f"(?i:{pattern})")
+        
+        try:
+            self._vendor_name_scanner = (
+                re.compile("|".join(f"(?:{body})" for body in alternatives)) if alternatives else None
+            )
+        except re.error:
+            self._vendor_name_scanner = None
+    
+    def _scan_vendor_names(self, text: str) -> Dict[str, str]:
+        # One pass of the combined alternation tells whether any vendor name
+        # pattern matches; only texts that match are checked vendor by vendor.
+        if self._vendor_name_scanner is not None and not self._vendor_name_scanner.search(text):
+            return {}
+        return self._match_vendor_names(text)
+    
+    def _match_vendor_names(self, text: str) -> Dict[str, str]:
+        hits = {}
+        for v_id, vendor in self.vendors.items():
+            for pattern in vendor._name_res:
+                if pattern.search(text):
+                    hits[v_id] = pattern.pattern
+                    break
+        return hits
+    
+    def _scan_vendor_names_many(self, texts: List[str]) -> List[Dict[str, str]]:
+        unique = [text for text in dict.fromkeys(texts) if text]
+        
+        if (
+            self._vendor_name_scanner is None
+            or len(unique) < 2
+            or any(
+                UNSAFE_IN_BATCH.search(pattern)
+                for vendor in self.vendors.values()
+                for pattern in vendor.name_patterns
+            )
+        ):
+            found = {text: self._scan_vendor_names(text) for text in unique}
+            return [found.get(text, {}) for text in texts]
+        
+        # One pass of the combined alternation over all names, joined with a
+        # separator, finds the names where some vendor pattern matches.
+        joined = "\x00".join(unique)
+        starts = []
+        offset = 0
+        for text in unique:
+            starts.append(offset)
+            offset += len(text) + 1
+        
+        matched = set()
+        rescan = set()
+        for match in self._vendor_name_scanner.finditer(joined):
+            start, end = match.span()
+            row = bisect_right(starts, start) - 1
+            if end > starts[row] + len(unique[row]):
+                # A match running across the separator also skipped positions
+                # in the rows it touched; scan those rows on their own.
+                rescan.update(range(row, bisect_right(starts, end - 1)))
+            else:
+                matched.add(row)
+        
+        found = {}
+        for row, text in enumerate(unique):
+            if row in rescan:
+                found[text] = self._scan_vendor_names(text)
+            elif row in matched:
+                found[text] = self._match_vendor_names(text)
+        return [found.get(text, {}) for text in texts]
     
     def _initialize_default_vendors(self):
         self.vendors["pacific_food"] = VendorPattern(
@@ -70,7 +360,7 @@ class VendorRegistry:
             },
             confidence=1.0,
             sample_count=4,
-            last_updated=datetime.now().isoformat(),
+            last_updated=_timestamp(),
             notes="Invoices always start with 37 (370-379). Be careful not to confuse with ORDER NO."
         )
         
@@ -95,21 +385,44 @@ class VendorRegistry:
             },
             confidence=1.0,
             sample_count=2,
-            last_updated=datetime.now().isoformat(),
+            last_updated=_timestamp(),
             notes="Invoice numbers always start with 200 and are 8 digits total."
         )
     
     def save_registry(self):
-        try:
-            data = {
-                v_id: asdict(vendor)
-                for v_id, vendor in self.vendors.items()
-            }
-            with open(self.registry_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            print(f"✓ Saved vendor registry to {self.registry_file}")
-        except Exception as e:
-            print(f"Warning: Could not save vendor registry: {e}")
+        with self._save_lock:
+            try:
+                data = {
+                    v_id: vendor._serialize()
+                    for v_id, vendor in self.vendors.items()
+                }
+                if ORJSON_AVAILABLE:
+                    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+                else:
+                    payload = json.dumps(data, indent=2).encode("utf-8")
+                
+                # Write a unique file next to the registry and swap it in, so
+                # readers and a crash mid-write never see a truncated file.
+                fd, tmp_name = tempfile.mkstemp(
+                    dir=self.registry_file.parent,
+                    prefix=f"{self.registry_file.name}.",
+                    suffix=".tmp"
+                )
+                tmp_file = Path(tmp_name)
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(payload)
+                    # mkstemp creates the file 0600; keep the registry's mode.
+                    mode = self.registry_file.stat().st_mode if self.registry_file.exists() else 0o644
+                    os.chmod(tmp_file, mode & 0o777)
+                    os.replace(tmp_file, self.registry_file)
+                finally:
+                    tmp_file.unlink(missing_ok=True)
+                self._pending_learns = 0
+                self._last_save = time.monotonic()
+                print(f"✓ Saved vendor registry to {self.registry_file}")
+            except Exception as e:
+                print(f"Warning: Could not save vendor registry: {e}")
     
     def detect_vendor(
         self, 
@@ -117,49 +430,98 @@ class VendorRegistry:
         invoice_number: str = "",
         ocr_text: str = "",
         debug: bool = False
+    ) -> Optional[VendorPattern]:
+        if ocr_text or debug:
+            return self._detect_vendor(vendor_name, invoice_number, ocr_text, debug)
+        
+        key = (vendor_name or "", str(invoice_number) if invoice_number else "")
+        with self._save_lock:
+            if key in self._detect_cache:
+                v_id = self._detect_cache[key]
+                return self.vendors[v_id] if v_id else None
+            
+            vendor = self._detect_vendor(vendor_name, invoice_number, ocr_text, debug)
+            if len(self._detect_cache) >= DETECT_CACHE_SIZE:
+                self._detect_cache.pop(next(iter(self._detect_cache)), None)
+            self._detect_cache[key] = vendor.vendor_id if vendor else None
+            return vendor
+    
+    def detect_vendor_batch(
+        self,
+        records: List[Dict[str, Any]],
+        debug: bool = False
+    ) -> List[Optional[VendorPattern]]:
+        vendor_names = [record.get("vendor_name") or "" for record in records]
+        all_name_hits = self._scan_vendor_names_many([name.lower() for name in vendor_names])
+        
+        return [
+            self._detect_vendor(
+                vendor_name,
+                record.get("invoice_number") or "",
+                record.get("ocr_text") or "",
+                debug,
+                name_hits=name_hits
+            )
+            for record, vendor_name, name_hits in zip(records, vendor_names, all_name_hits)
+        ]
+    
+    def _detect_vendor(
+        self,
+        vendor_name: str,
+        invoice_number: str,
+        ocr_text: str,
+        debug: bool,
+        name_hits: Optional[Dict[str, str]] = None
     ) -> Optional[VendorPattern]:
         scores = {}
+        vendor_name_lower = vendor_name.lower() if vendor_name else ""
+        inv_str = str(invoice_number) if invoice_number else ""
+        ocr_lower = ocr_text.lower() if ocr_text else ""
+        if name_hits is None:
+            name_hits = self._scan_vendor_names(vendor_name_lower) if vendor_name_lower else {}
+        prefix_hits = self._match_invoice_prefixes(inv_str) if inv_str else {}
+        partial = {}
         
-        for v_id, vendor in self.vendors.items():
+        for v_id in self._in_registry_order(name_hits.keys() | prefix_hits.keys()):
             score = 0.0
-            reasons = []
-            if vendor_name:
-                vendor_name_lower = vendor_name.lower()
-                for pattern in vendor.name_patterns:
-                    if re.search(pattern, vendor_name_lower, re.IGNORECASE):
-                        score += 0.5
-                        reasons.append(f"name_match:{pattern}")
-                        break
-            
-            if invoice_number:
-                inv_str = str(invoice_number)
-                for pattern in vendor.invoice_prefix_patterns:
-                    if re.match(pattern, inv_str):
-                        score += 0.3
-                        reasons.append(f"invoice_prefix:{pattern}")
-                        break
-            
-            if ocr_text:
-                ocr_lower = ocr_text.lower()
-                for pattern in vendor.name_patterns:
-                    if re.search(pattern, ocr_lower, re.IGNORECASE):
-                        score += 0.2
-                        reasons.append("ocr_match")
-                        break
+            if v_id in name_hits:
+                score += 0.5
+            if v_id in prefix_hits:
+                score += 0.3
+            partial[v_id] = score
+        
+        # The OCR scan adds at most 0.2, so skip it when the cheap signals
+        # already decide the winner and no other vendor can catch up.
+        best_partial = max(partial.values(), default=0.0)
+        contenders = sum(1 for score in partial.values() if score + 0.2 >= best_partial)
+        ocr_hits = {}
+        if ocr_lower and (debug or best_partial < 0.5 or contenders > 1):
+            ocr_hits = self._scan_vendor_names(ocr_lower)
+        
+        best_vendor_id = None
+        best_score = 0.0
+        for v_id in self._in_registry_order(partial.keys() | ocr_hits.keys()):
+            score = partial.get(v_id, 0.0)
+            if v_id in ocr_hits:
+                score += 0.2
             
-            if score > 0:
+            if score > best_score:
+                best_vendor_id, best_score = v_id, score
+            if debug and score > 0:
+                reasons = []
+                if v_id in name_hits:
+                    reasons.append(f"name_match:{name_hits[v_id]}")
+                if v_id in prefix_hits:
+                    reasons.append(f"invoice_prefix:{prefix_hits[v_id]}")
+                if v_id in ocr_hits:
+                    reasons.append("ocr_match")
                 scores[v_id] = (score, reasons)
-                if debug:
-                    print(f"  [DEBUG] Vendor '{v_id}': score={score:.2f}, reasons={reasons}")
+                print(f"  [DEBUG] Vendor '{v_id}': score={score:.2f}, reasons={reasons}")
         
-        if scores:
-            best_vendor_id = max(scores.keys(), key=lambda k: scores[k][0])
-            best_score, reasons = scores[best_vendor_id]
-            
-            if best_score >= 0.5:
-                if debug:
-                    print(f"  [DEBUG] Detected vendor: {best_vendor_id} (score={best_score:.2f})")
-                return self.vendors[best_vendor_id]
+        if best_score >= 0.5:
+            if debug:
+                print(f"  [DEBUG] Detected vendor: {best_vendor_id} (score={best_score:.2f})")
+            return self.vendors[best_vendor_id]
         
         if debug:
             print(f"  [DEBUG] No vendor detected (scores: {scores})")
@@ -182,7 +544,8 @@ class VendorRegistry:
         if len(inv_str) > vendor.invoice_number_max_length:
             return False, f"Too long (max: {vendor.invoice_number_max_length})"
         
-        if not re.match(vendor.invoice_number_regex, inv_str):
+        min_width, max_width = vendor._invnum_lengths
+        if not min_width <= len(inv_str) <= max_width or not vendor._invnum_match(inv_str):
             return False, f"Doesn't match pattern: {vendor.invoice_number_regex}"
         
         if debug:
@@ -191,28 +554,34 @@ class VendorRegistry:
         return True, None
     
     def get_extraction_instructions(self, vendor: VendorPattern) -> str:
-        instructions = f"""
-VENDOR: {vendor.vendor_name.upper()}
-- Vendor Name: MUST be exactly "{vendor.vendor_name}"
-"""
+        if vendor._instructions is not None:
+            return vendor._instructions
         
         inv_prefixes = ", ".join(vendor.invoice_prefix_patterns)
-        instructions += f"""- Invoice Number: Located at {vendor.invoice_number_location}, labeled "{vendor.invoice_number_label}"
+        parts = [f"""
+VENDOR: {vendor.vendor_name.upper()}
+- Vendor Name: MUST be exactly "{vendor.vendor_name}"
+- Invoice Number: Located at {vendor.invoice_number_location}, labeled "{vendor.invoice_number_label}"
   * CRITICAL: Invoice number MUST match pattern: {vendor.invoice_number_regex}
   * Valid prefixes: {inv_prefixes}
   * Length: {vendor.invoice_number_min_length}-{vendor.invoice_number_max_length} digits
   * DO NOT confuse with other numbers (PO, Order No, etc.)
-"""
+"""]
         
         if vendor.column_mappings:
-            instructions += "\n- Column Mappings:\n"
-            for field, column in vendor.column_mappings.items():
-                instructions += f"  * {field}: '{column}' column\n"
+            parts.append("\n- Column Mappings:\n")
+            parts.extend(
+                f"  * {field_name}: '{column}' column\n"
+                for field_name, column in vendor.column_mappings.items()
+            )
         
         if vendor.notes:
-            instructions += f"\nIMPORTANT NOTES:\n{vendor.notes}\n"
+            parts.append(f"\nIMPORTANT NOTES:\n{vendor.notes}\n")
         
-        return instructions
+        # Only add_vendor and load_registry change these fields, and both
+        # create fresh VendorPattern objects.
+        vendor._instructions = "".join(parts)
+        return vendor._instructions
     
     def add_vendor(
         self,
@@ -226,22 +595,26 @@ VENDOR: {vendor.vendor_name.upper()}
     ):
         min_len, max_len = invoice_number_length
         
-        self.vendors[vendor_id] = VendorPattern(
-            vendor_id=vendor_id,
-            vendor_name=vendor_name,
-            name_patterns=name_patterns,
-            invoice_prefix_patterns=invoice_prefix_patterns,
-            invoice_number_regex=invoice_number_regex,
-            invoice_number_min_length=min_len,
-            invoice_number_max_length=max_len,
-            invoice_number_location=kwargs.get("invoice_number_location", "top_right"),
-            invoice_number_label=kwargs.get("invoice_number_label", "Invoice"),
-            column_mappings=kwargs.get("column_mappings", {}),
-            confidence=kwargs.get("confidence", 0.8),
-            sample_count=kwargs.get("sample_count", 0),
-            last_updated=datetime.now().isoformat(),
-            notes=kwargs.get("notes", "")
-        )
+        with self._save_lock:
+            self.vendors[vendor_id] = VendorPattern(
+                vendor_id=vendor_id,
+                vendor_name=vendor_name,
+                name_patterns=name_patterns,
+                invoice_prefix_patterns=invoice_prefix_patterns,
+                invoice_number_regex=invoice_number_regex,
+                invoice_number_min_length=min_len,
+                invoice_number_max_length=max_len,
+                invoice_number_location=kwargs.get("invoice_number_location", "top_right"),
+                invoice_number_label=kwargs.get("invoice_number_label", "Invoice"),
+                column_mappings=kwargs.get("column_mappings", {}),
+                confidence=kwargs.get("confidence", 0.8),
+                sample_count=kwargs.get("sample_count", 0),
+                last_updated=_timestamp(),
+                notes=kwargs.get("notes", "")
+            )
+            self._compile_combined()
+            self._build_prefix_index()
+            self._detect_cache.clear()
         
         print(f"✓ Added vendor: {vendor_name} ({vendor_id})")
         self.save_registry()
@@ -255,20 +628,32 @@ VENDOR: {vendor.vendor_name.upper()}
         if vendor_id not in self.vendors:
             return
         
-        vendor = self.vendors[vendor_id]
-        vendor.sample_count += 1
-        
-        if was_successful:
-            vendor.confidence = min(1.0, vendor.confidence + 0.01)
-        else:
-            vendor.confidence = max(0.5, vendor.confidence - 0.05)
-        
-        vendor.last_updated = datetime.now().isoformat()
-        
-        self.save_registry()
+        with self._save_lock:
+            vendor = self.vendors[vendor_id]
+            vendor.sample_count += 1
+            
+            if was_successful:
+                vendor.confidence = min(1.0, vendor.confidence + 0.01)
+            else:
+                vendor.confidence = max(0.5, vendor.confidence - 0.05)
+            
+            vendor.last_updated = _timestamp()
+            vendor._serialized = None
+            
+            self._pending_learns += 1
+            if (
+                self._pending_learns >= LEARN_FLUSH_EVERY
+                or time.monotonic() - self._last_save >= LEARN_FLUSH_SECONDS
+            ):
+                self.save_registry()
+    
+    def flush(self):
+        with self._save_lock:
+            if self._pending_learns:
+                self.save_registry()
     
     def get_all_vendors(self) -> List[Dict[str, Any]]:
-        return [asdict(vendor) for vendor in self.vendors.values()]
+        return [vendor.to_dict() for vendor in self.vendors.values()]
     
     def suggest_vendor_pattern(
         self,
@@ -284,13 +669,29 @@ VENDOR: {vendor.vendor_name.upper()}
         if not invoice_numbers:
             return {}
         
-        prefix_counts = {}
+        # Prefix trie over the first (up to four) characters; each node is
+        # [count, creation order, children] so ties keep first-seen order.
+        trie = {}
+        created = 0
         for inv_num in invoice_numbers:
-            for i in range(1, min(5, len(inv_num))):
-                prefix = inv_num[:i]
-                prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
+            children = trie
+            for char in inv_num[:min(5, len(inv_num)) - 1]:
+                node = children.get(char)
+                if node is None:
+                    node = children[char] = [0, created, {}]
+                    created += 1
+                node[0] += 1
+                children = node[2]
         
-        common_prefix = max(prefix_counts.keys(), key=lambda p: prefix_counts[p])
+        candidates = []
+        stack = [("", trie)]
+        while stack:
+            prefix, children = stack.pop()
+            for char, (count, order, grandchildren) in children.items():
+                candidates.append(((count, len(prefix) + 1, -order), prefix + char))
+                stack.append((prefix + char, grandchildren))
+        
+        common_prefix = max(candidates)[1]
         prefix_pattern = f"^{common_prefix}"
         
         lengths = [len(inv) for inv in invoice_numbers]
@@ -321,13 +722,19 @@ VENDOR: {vendor.vendor_name.upper()}
         return suggestion
 
 
-_registry = None
+_registry: Optional[VendorRegistry] = None
+_registry_lock = threading.Lock()
 
 def get_vendor_registry(registry_file: str = "vendor_registry.json") -> VendorRegistry:
     global _registry
-    if _registry is None:
-        _registry = VendorRegistry(registry_file)
-    return _registry
+    registry = _registry
+    if registry is not None:
+        return registry
+    
+    with _registry_lock:
+        if _registry is None:
+            _registry = VendorRegistry(registry_file)
+        return _registry
 
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+for module in ("pdf2image", "PIL", "cv2", "numpy"):
+    pytest.importorskip(module)
+
+from PIL import Image
+
+from core.invoice_extractor import EnhancedInvoiceExtractor
+
+
+def make_extractor():
+    extractor = EnhancedInvoiceExtractor.__new__(EnhancedInvoiceExtractor)
+    extractor.vendor_registry = None
+    return extractor
+
+
+@pytest.mark.parametrize("total", ["1234.50", 1234.5])
+def test_confidence_scores_string_total_like_number(total):
+    extractor = make_extractor()
+    result = {
+        "invoice_number": "378093",
+        "date": "2025-07-15",
+        "vendor_name": "Pacific Food Importers",
+        "total_amount": total,
+        "line_items": []
+    }
+    
+    assert extractor.validate_extraction(result, strict=False)
+    assert extractor._calculate_confidence(result, {}) == pytest.approx(0.6)
+
+
+def test_confidence_ignores_unparseable_total():
+    extractor = make_extractor()
+    result = {
+        "invoice_number": "378093",
+        "date": "2025-07-15",
+        "vendor_name": "Pacific Food Importers",
+        "total_amount": "n/a"
+    }
+    
+    assert extractor._calculate_confidence(result, {}) == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("attr", [
+    "regex_confidence_threshold",
+    "layoutlmv3_confidence_threshold",
+    "ocr_confidence_threshold",
+    "use_enhanced_ocr",
+])
+def test_page_cache_key_changes_with_cascade_settings(attr):
+    extractor = make_extractor()
+    extractor.model = "claude-sonnet"
+    extractor.use_regex = True
+    extractor.use_layoutlmv3 = True
+    extractor.use_ocr = True
+    extractor.ocr_engine = "tesseract"
+    extractor.use_enhanced_ocr = True
+    extractor.claude_client = None
+    extractor.regex_confidence_threshold = 0.60
+    extractor.layoutlmv3_confidence_threshold = 0.50
+    extractor.ocr_confidence_threshold = 0.50
+    image = Image.new("RGB", (4, 4), "white")
+
+    before = extractor._page_cache_key(image)
+    value = getattr(extractor, attr)
+    setattr(extractor, attr, (not value) if isinstance(value, bool) else value + 0.1)
+
+    assert extractor._page_cache_key(image) != before
@@ -0,0 +1,107 @@
+from pathlib import Path
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+for module in ("pdf2image", "PIL", "cv2", "numpy"):
+    pytest.importorskip(module)
+
+from core.vendor_registry import VendorRegistry
+
+
+def detect_vendor_per_pattern(registry, vendor_name="", invoice_number="", ocr_text=""):
+    # Reference implementation: every pattern of every vendor, one re.search each.
+    scores = {}
+    for v_id, vendor in registry.vendors.items():
+        score = 0.0
+        if vendor_name:
+            for pattern in vendor.name_patterns:
+                if re.search(pattern, vendor_name.lower(), re.IGNORECASE):
+                    score += 0.5
+                    break
+        if invoice_number:
+            for pattern in vendor.invoice_prefix_patterns:
+                if re.match(pattern, str(invoice_number)):
+                    score += 0.3
+                    break
+        if ocr_text:
+            for pattern in vendor.name_patterns:
+                if re.search(pattern, ocr_text.lower(), re.IGNORECASE):
+                    score += 0.2
+                    break
+        if score > 0:
+            scores[v_id] = score
+
+    if scores:
+        best_vendor_id = max(scores.keys(), key=lambda k: scores[k])
+        if scores[best_vendor_id] >= 0.5:
+            return best_vendor_id
+    return None
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = VendorRegistry(str(tmp_path / "vendor_registry.json"))
+    # Overlapping names, so one vendor's match can start inside another's.
+    registry.add_vendor(
+        vendor_id="pacific_foods_co",
+        vendor_name="Pacific Foods Co",
+        name_patterns=[r"food\s+importers?\s+co", r"Pacific\s+Foods"],
+        invoice_prefix_patterns=["^38"],
+        invoice_number_regex=r"\d{6}",
+        invoice_number_length=(6, 6)
+    )
+    registry.add_vendor(
+        vendor_id="quality_produce",
+        vendor_name="Quality Produce",
+        name_patterns=[r"quality\s+produce"],
+        invoice_prefix_patterns=["^2006"],
+        invoice_number_regex=r"\d{8}",
+        invoice_number_length=(8, 8)
+    )
+    return registry
+
+
+@pytest.mark.parametrize("vendor_name,invoice_number,ocr_text", [
+    ("Pacific Food Importers", "378093", ""),
+    ("Pacific Food Importers Co", "", ""),
+    ("PACIFIC FOODS", "381000", ""),
+    ("Frank's Quality Produce", "20065629", ""),
+    ("Quality Produce", "", "frank's quality produce\n3800 1st ave s"),
+    ("", "20065629", "Invoice from Frank's Quality Produce"),
+    ("", "378093", "customer copy\npacific food importers co, kent wa"),
+    ("Unknown Supplier", "999", "nothing to see here"),
+    ("", "", "pacific food importers co"),
+    ("", "", ""),
+])
+def test_detect_vendor_matches_per_pattern_scan(registry, vendor_name, invoice_number, ocr_text):
+    expected = detect_vendor_per_pattern(registry, vendor_name, invoice_number, ocr_text)
+
+    vendor = registry.detect_vendor(vendor_name, invoice_number, ocr_text)
+
+    assert (vendor.vendor_id if vendor else None) == expected
+
+
+def test_detect_vendor_batch_matches_detect_vendor(registry):
+    records = [
+        {"vendor_name": "Pacific Food Importers Co", "invoice_number": "378093"},
+        {"vendor_name": "Frank's Quality Produce", "invoice_number": "20065629"},
+        {"vendor_name": "Pacific Food Importers Co", "invoice_number": ""},
+        {"vendor_name": "", "invoice_number": "", "ocr_text": "quality produce"},
+        {"vendor_name": "Unknown Supplier"},
+    ]
+
+    batch = registry.detect_vendor_batch(records)
+
+    assert [vendor.vendor_id if vendor else None for vendor in batch] == [
+        detect_vendor_per_pattern(
+            registry,
+            record.get("vendor_name", ""),
+            record.get("invoice_number", ""),
+            record.get("ocr_text", "")
+        )
+        for record in records
+    ]